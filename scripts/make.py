@@ -3,6 +3,7 @@ import re
 import sys
 import shutil
 import hashlib
+import glob
 
 src_dir = "./src/content/blog/"
 pbl_dir = "./public/blog/"
@@ -237,11 +238,87 @@ def batch():
                 shutil.copy(tmp_dir + "index.pdf", bch_dir + filename.lower() + ".pdf")
                 shutil.rmtree(tmp_dir)
 
+def pdftext(path):
+        # Page count and extracted text, used to check that optimisation is lossless
+        from pypdf import PdfReader
+        pages = PdfReader(path).pages
+        return len(pages), [page.extract_text() for page in pages]
+
+def pdfdedup(pdf):
+        # Point every reference to a byte-identical stream at a single copy;
+        # the unreferenced copies are then dropped when the file is saved
+        import pikepdf
+        canon = {}
+        remap = {}
+        for obj in pdf.objects:
+                if not isinstance(obj, pikepdf.Stream): continue
+                head = pikepdf.Dictionary({k: v for k, v in obj.stream_dict.items() if k != "/Length"})
+                key = hashlib.sha256(head.unparse() + obj.read_raw_bytes()).hexdigest()
+                if key in canon: remap[obj.objgen] = canon[key]
+                else: canon[key] = obj.objgen
+        if not remap: return 0
+        def relink(container):
+                items = container.items() if isinstance(container, pikepdf.Dictionary) else enumerate(container)
+                for k, v in list(items):
+                        if isinstance(v, pikepdf.Object) and v.is_indirect and v.objgen in remap:
+                                container[k] = pdf.get_object(remap[v.objgen])
+                        elif isinstance(v, (pikepdf.Dictionary, pikepdf.Array)) and not v.is_indirect:
+                                relink(v)
+        for obj in pdf.objects:
+                if isinstance(obj, pikepdf.Stream): relink(obj.stream_dict)
+                elif isinstance(obj, (pikepdf.Dictionary, pikepdf.Array)): relink(obj)
+        relink(pdf.trailer)
+        return len(remap)
+
+def pdfoptm(path):
+        import pikepdf
+        tmp = path + ".tmp"
+        with pikepdf.open(path) as pdf:
+                for obj in pdf.objects:
+                        if isinstance(obj, pikepdf.Dictionary) and obj.get("/Type") == "/FontDescriptor" \
+                                and any(k in obj for k in ("/FontFile", "/FontFile2", "/FontFile3")) \
+                                and not re.match(r"^/[A-Z]{6}\+", str(obj.get("/FontName"))):
+                                print(f"      Font not subset: {obj.get('/FontName')} in {path}")
+                dups = pdfdedup(pdf)
+                pdf.remove_unreferenced_resources()
+                pdf.save(tmp, object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                        compress_streams=True, recompress_flate=True)
+        before, after = os.path.getsize(path), os.path.getsize(tmp)
+        if after >= before:
+                os.remove(tmp)
+                print(f"     No saving, kept: {path}")
+                return 0
+        if pdftext(path) != pdftext(tmp):
+                os.remove(tmp)
+                print(f"  Verification failed: {path}; kept original")
+                return 0
+        os.replace(tmp, path)
+        print(f"            Optimised: {path} {before} -> {after} bytes (-{before - after}; {dups} duplicates)")
+        return before - after
+
+def optimize():
+        # Optional post-compile stage: rewrites published PDFs with object streams,
+        # recompressed streams and duplicate streams merged, keeping a file only
+        # when it is smaller and its page count and extracted text are unchanged
+        try:
+                import pikepdf, pypdf
+        except ImportError:
+                print("make: optimize requires pikepdf and pypdf...")
+                return
+        pikepdf.settings.set_flate_compression_level(9)
+        saved = 0
+        paths = sorted(glob.glob(pbl_dir + "*/index.pdf")) + sorted(glob.glob(bch_dir + "compilation_*.pdf"))
+        for path in paths:
+                saved += pdfoptm(path)
+        print(f"          Total saved: {saved} bytes over {len(paths)} files")
+
 if len(sys.argv) != 2:
         print("make: Incorrect options...")
 elif sys.argv[1] == "post":
         post()
 elif sys.argv[1] == "batch":
         batch()
+elif sys.argv[1] == "optimize":
+        optimize()
 else:
         print("make: Doing nothing...")
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from urllib.parse import urlsplit
+
+# Shared transport for writer.py: one pooled HTTP session, per-call deadlines,
+# jittered exponential backoff, per-host concurrency limits, and conditional
+# GET caching. `requests` is imported lazily, like the other heavy dependencies.
+
+cache_dir = ".cache/http/"
+
+attempts = 4        # tries per call, including the first
+backoff_base = 1.0  # seconds; doubles each retry up to `backoff_cap`
+backoff_cap = 30.0
+http_timeout = (5, 30)  # connect, read
+http_deadline = 120     # seconds for a whole fetch, retries included
+llm_timeout = 900       # seconds for a single completion
+llm_deadline = 1800     # seconds for a completion, retries included
+pool_size = 8
+
+# Maximum number of calls in flight per host (or provider name)
+concurrency = {
+    "api.x.ai": 4,
+    "api.deepseek.com": 4,
+    "news.ycombinator.com": 2,
+}
+default_concurrency = 4
+
+_session = None
+_session_lock = threading.Lock()
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+def session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            # Retries are handled by `call`, not by urllib3
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["User-Agent"] = "c13n-writer"
+    return _session
+
+def semaphore(key: str):
+    with _semaphores_lock:
+        if key not in _semaphores:
+            _semaphores[key] = threading.BoundedSemaphore(concurrency.get(key, default_concurrency))
+        return _semaphores[key]
+
+class RetryableStatus(Exception):
+    """An HTTP response whose status is worth retrying (408, 429, 5xx)."""
+    def __init__(self, status_code: int, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+def transient(exc: Exception) -> bool:
+    # Duck-typed so that neither openai, grpc nor requests has to be imported here
+    code = getattr(exc, "code", None)
+    if callable(code):  # grpc.RpcError, raised by xai_sdk
+        return getattr(code(), "name", "") in ("UNAVAILABLE", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED", "ABORTED", "INTERNAL")
+    status = getattr(exc, "status_code", None)  # openai.APIStatusError, RetryableStatus
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+    # Only connection failures and timeouts, matched by name along the MRO:
+    # requests.RequestException is an OSError, but so are InvalidURL and friends
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    return bool(names & {
+        "ConnectionError", "Timeout", "TimeoutError", "ChunkedEncodingError",  # builtins, requests
+        "APIConnectionError", "APITimeoutError",  # openai
+    })
+
+def backoff(attempt: int) -> float:
+    # Full jitter: uniform over [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+
+def call(key: str, fn, deadline: float, retries: int = None, attempt_timeout: float = 0):
+    """
+    Run `fn(timeout)` under the concurrency limit for `key`, retrying
+    transient failures with jittered backoff until `deadline` seconds
+    have passed. `timeout` is the time left, for fn to pass on. When fn
+    cannot shorten its own timeout, pass it as `attempt_timeout`: no
+    attempt is then started with less than that much time left.
+    """
+    retries = attempts if retries is None else retries
+    end = time.monotonic() + deadline
+    for attempt in range(retries):
+        remaining = end - time.monotonic()
+        if remaining <= 0 or not semaphore(key).acquire(timeout=remaining):
+            raise DeadlineExceeded(f"{key}: deadline of {deadline:.0f} s exceeded")
+        try:
+            remaining = end - time.monotonic()
+            if remaining < attempt_timeout:
+                raise DeadlineExceeded(f"{key}: {remaining:.0f} s left, less than one {attempt_timeout:.0f} s attempt")
+            return fn(remaining)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if not transient(e) or attempt == retries - 1:
+                raise
+            delay = max(backoff(attempt), getattr(e, "retry_after", None) or 0)
+            if time.monotonic() + delay + attempt_timeout >= end:
+                raise
+            print(f"        Retrying call: {key} in {delay:.1f} s; {e}")
+        finally:
+            semaphore(key).release()
+        time.sleep(delay)
+
+def _cache_paths(url: str):
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return os.path.join(cache_dir, key + ".json"), os.path.join(cache_dir, key + ".body")
+
+def _retry_after(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def fetch(url: str, deadline: float = http_deadline, cache: bool = True) -> bytes:
+    """
+    GET `url` and return the body. With `cache`, the ETag/Last-Modified of the
+    last 200 response are sent back, and a 304 is answered from disk.
+    """
+    meta_path, body_path = _cache_paths(url)
+    headers = {}
+    if cache and os.path.exists(meta_path) and os.path.exists(body_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    def attempt(remaining):
+        timeout = tuple(min(t, remaining) for t in http_timeout)
+        response = session().get(url, headers=headers, timeout=timeout)
+        if response.status_code in (408, 429) or response.status_code >= 500:
+            raise RetryableStatus(response.status_code, _retry_after(response.headers.get("Retry-After")))
+        return response
+
+    response = call(urlsplit(url).hostname or url, attempt, deadline)
+    response.raise_for_status()
+    if response.status_code == 304:
+        with open(body_path, "rb") as f:
+            return f.read()
+    if cache and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(body_path, "wb") as f:
+            f.write(response.content)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }, f)
+    return response.content
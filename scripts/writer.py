@@ -1,66 +1,83 @@
-from openai import OpenAI
-from bs4 import BeautifulSoup
-import requests
+import bisect
 import random
 import time
 import datetime
 import os
+import sys
 import glob
-import yaml
 import re
 from typing import List, Tuple, Dict
 import clean_text
-from xai_sdk import Client
-from xai_sdk.chat import system, user
+import transport
 
-path_to = f'src/content/blog/{datetime.datetime.now().strftime("%Y-%m-%d")}'
+# Heavy dependencies (openai, xai_sdk, bs4, requests, yaml) are imported where
+# they are used, so that the pure text utilities below can be imported, and
+# `writer.py lint` / `writer.py beautify` can start, without any of them.
 
-if os.path.exists(path_to):
-    print(f"   Skipping directory: {path_to}")
-    exit(0)
-else:
-    os.makedirs(path_to, exist_ok=True)
-    print(f"     Making directory: {path_to}")
+blog_dir = "src/content/blog"
 
-start = time.time()
-print("    Connecting remote:")
-deepseek = OpenAI(base_url="https://api.deepseek.com", api_key=os.environ.get("DS_APIKEY"))
-xai_client = Client(api_key=os.getenv("XAI_API_KEY"), timeout=7200)
-print(f"   Time spent on init: {time.time() - start:.1f} s")
+_deepseek = None
+_xai_client = None
+
+def deepseek_client():
+    global _deepseek
+    if _deepseek is None:
+        from openai import OpenAI
+        # Retries are handled by transport.call
+        _deepseek = OpenAI(base_url="https://api.deepseek.com", api_key=os.environ.get("DS_APIKEY"),
+                           timeout=transport.llm_timeout, max_retries=0)
+    return _deepseek
+
+def xai_client():
+    global _xai_client
+    if _xai_client is None:
+        from xai_sdk import Client
+        _xai_client = Client(api_key=os.getenv("XAI_API_KEY"), timeout=transport.llm_timeout)
+    return _xai_client
 
 def generate(context, provider, model): #for openrouter
-    completion = provider.chat.completions.create(
-        model=model,
-        messages=context
-    )
+    def attempt(remaining):
+        return provider.with_options(timeout=min(transport.llm_timeout, remaining)).chat.completions.create(
+            model=model,
+            messages=context
+        )
+    completion = transport.call("api.deepseek.com", attempt, transport.llm_deadline)
     return completion.choices[0].message.content.strip()
 
 def grok_generate(context, provider, model): #for xai
     """
     e.g. 
     model="grok-3-mini"
-    provider=xai_client
+    provider=xai_client()
     context=[system("You are a highly intelligent AI assistant."),user("What is 101*3?")]
     """
-    chat = provider.chat.create(
-        model=model,
-        messages=context,
-    )
-    response = chat.sample()
+    # The per-attempt timeout is fixed on the client, so attempts are only
+    # started while a whole transport.llm_timeout fits before the deadline
+    def attempt(remaining):
+        chat = provider.chat.create(
+            model=model,
+            messages=context,
+        )
+        return chat.sample()
+    response = transport.call("api.x.ai", attempt, transport.llm_deadline, attempt_timeout=transport.llm_timeout)
     return response.content.strip()
 
 def scrape_website(url, css_selector):
-    response = requests.get(url)
-    if response.status_code == 200:
-        soup = BeautifulSoup(response.content, "html.parser")
-        elements = soup.select(css_selector)
-        return elements
-    else: return []
+    from bs4 import BeautifulSoup
+    try:
+        content = transport.fetch(url)
+    except Exception as e:
+        print(f"       Error scraping: {url}; {e}")
+        return []
+    soup = BeautifulSoup(content, "html.parser")
+    elements = soup.select(css_selector)
+    return elements
 
 # Get existing blog posts
 def get_existing_blog_posts():
+    import yaml
     blog_posts = []
-    blog_paths = glob.glob("src/content/blog/*/index.md")
+    blog_paths = glob.glob(f"{blog_dir}/*/index.md")
 
     for path in blog_paths:
         try:
@@ -79,71 +96,89 @@ def get_existing_blog_posts():
 
     return blog_posts
 
-# Get existing blog posts
-existing_posts = get_existing_blog_posts()
-existing_posts_text = "\n".join([post["title"] for post in existing_posts])
-print(f"              Loading: {len(existing_posts)} existing blog posts")
-
-topics = [topic.get_text(strip=True) for topic in scrape_website("https://news.ycombinator.com/", ".titleline")]
-topics_text = "\n".join(random.choices(topics, k=random.randint(5, len(topics))))
-print(f"              Scraped: {len(topics)} topics")
-
 def extract_topic(topics):
-    global deepseek, existing_posts_text
+    from xai_sdk.chat import system, user
     # return generate([
     #     {"role": "system", "content": f"你在为一篇技术博客确定一个主题。直接用中文输出主题。"},
     #     {"role": "user", "content": f"阅读以下是HackerNews的热门文章，然后写一个可以用于技术博客的主题。这个主题应当是一个通用、普通的技术，不能是一个事件或其它东西。\n\n{topics}\n\n只需要一个主题，直接输出。"},
-    # ], deepseek, "deepseek-chat")
+    # ], deepseek_client(), "deepseek-chat")
     return grok_generate([
         system("你在为一篇技术博客确定一个主题。直接用中文输出主题。"),
         user(f"阅读以下是HackerNews的热门文章，然后写一个可以用于技术博客的主题。这个主题应当是一个通用、普通的技术，不能是一个事件或其它东西。\n\n{topics}\n\n只需要一个主题，直接输出。")
-    ], xai_client, "grok-4-1-fast-non-reasoning")
+    ], xai_client(), "grok-4-1-fast-non-reasoning")
 
 def outline(topic):
-    global deepseek
+    from xai_sdk.chat import system, user
     # return generate([
     #     {"role": "user", "content": f"我要写一篇关于「{topic}」的博客文章。帮我列一个详细的文章提纲。"}
-    # ], deepseek, "deepseek-reasoner")
+    # ], deepseek_client(), "deepseek-reasoner")
     return grok_generate([
         user(f"我要写一篇关于「{topic}」的博客文章。帮我列一个详细的文章提纲。")
-    ], xai_client, "grok-4-1-fast-non-reasoning")
+    ], xai_client(), "grok-4-1-fast-non-reasoning")
 
 def write_from_outline(outline):
-    global deepseek, existing_posts_text
+    from xai_sdk.chat import system, user
     # return generate([
     #     {"role": "system", "content": "你是一位专业技术博客作者。在写作时请遵循以下中文排版规范：使用全角中文标点；专有名词大小写正确；英文、数字使用半角字符；使用直角引号「」。"},
     #     {"role": "user", "content": f"{outline}\n\n根据这个提纲中关于技术知识的部分，写出一篇技术博客文章。文章中避免出现图片，不能使用任何列表。每一段出现的代码都进行较为详细的解读。在讲述内容时尽量使用段落的语言，语言风格可以略偏专业，但保持清晰。使用Markdown（要求符合Common Markdown规范）输出，使用LaTeX公式（注意：数学的开闭定界符前后不能有字母或数字字符。像x$a + b = c$或$a + b = c$1将无法渲染为数学公式（所有$会被渲染为$）；但x $\\infty$ 1和($\\infty$)会正常渲染），标题尽量只用一级标题 `#` 和二级标题 `##`，不要用分割线。请遵循中文排版规范，使用正确的标点符号。直接输出正文。"}
-    # ], deepseek, "deepseek-reasoner")
+    # ], deepseek_client(), "deepseek-reasoner")
     return grok_generate([
         system("你是一位专业技术博客作者。在写作时请遵循以下中文排版规范：使用全角中文标点；专有名词大小写正确；英文、数字使用半角字符；使用直角引号「」。"),
         user(f"{outline}\n\n根据这个提纲中关于技术知识的部分，写出一篇技术博客文章。文章中避免出现图片，不能使用任何列表。每一段出现的代码都进行较为详细的解读。在讲述内容时尽量使用段落的语言，语言风格可以略偏专业，但保持清晰。使用Markdown（要求符合Common Markdown规范）输出，使用LaTeX公式（注意：数学的开闭定界符前后不能有字母或数字字符。像x$a + b = c$或$a + b = c$1将无法渲染为数学公式（所有$会被渲染为$）；但x $\\infty$ 1和($\\infty$)会正常渲染），标题尽量只用一级标题 `#` 和二级标题 `##`，不要用分割线。请遵循中文排版规范，使用正确的标点符号。直接输出正文。")
-    ], xai_client, "grok-4-1-fast-non-reasoning")
+    ], xai_client(), "grok-4-1-fast-non-reasoning")
 
 def summary(article):
-    global deepseek
+    from xai_sdk.chat import system, user
     # return generate([
     #     {"role": "system", "content": "你是一个技术博客简介写作者，简介不一定需要涵盖文章的全部内容，能起到一定的提示作用即可。直接输出简介。遵循以下中文排版规范：使用全角中文标点；专有名词大小写正确；英文、数字使用半角字符。注意简介被作为副标题使用，不是一句句子，不要以句号结尾。"},
     #     {"role": "user", "content": f"给这篇文章写一个15字的简短介绍：\n\n{article}"}
-    # ], deepseek, "deepseek-chat")
+    # ], deepseek_client(), "deepseek-chat")
     return grok_generate([
         system("你是一个技术博客简介写作者，简介不一定需要涵盖文章的全部内容，能起到一定的提示作用即可。直接输出简介。遵循以下中文排版规范：使用全角中文标点；专有名词大小写正确；英文、数字使用半角字符。注意简介被作为副标题使用，不是一句句子，不要以句号结尾。"),
         user(f"给这篇文章写一个15字的简短介绍：\n\n{article}")
-    ], xai_client, "grok-4-1-fast-non-reasoning")
+    ], xai_client(), "grok-4-1-fast-non-reasoning")
 
 # LaTeX error handling 
+fence_pattern = re.compile(r'^[ \t]*(`{3,}|~{3,})[^\n]*\n[\s\S]*?(?:^[ \t]*\1[ \t]*$|\Z)', re.MULTILINE)
+code_pattern = re.compile(r'(`+)[^`\n](?:[^\n]*?[^`\n])?\1(?!`)')
+
+def code_spans(markdown_text: str) -> List[Tuple[int, int]]:
+    spans = [(m.start(), m.end()) for m in fence_pattern.finditer(markdown_text)]
+    # Blank out fenced blocks so their backticks cannot open inline code
+    masked = list(markdown_text)
+    for start, end in spans:
+        masked[start:end] = " " * (end - start)
+    spans += [(m.start(), m.end()) for m in code_pattern.finditer("".join(masked))]
+    return spans
+
+block_pattern = re.compile(r'(\$\$[\s\S]+?\$\$)', re.DOTALL)
+inline_pattern = re.compile(r'(?<!\\)(\$(?:\\.|[^$])+?\$)', re.DOTALL)
+
 def extract_latex_segments(markdown_text: str) -> List[Tuple[str, int, int]]:
     segments: List[Tuple[str,int,int]] = []
-    block_pattern = re.compile(r'(\$\$[\s\S]+?\$\$)', re.DOTALL)
     for m in block_pattern.finditer(markdown_text):
         segments.append((m.group(1), m.start(), m.end()))
 
-    inline_pattern = re.compile(r'(?<!\\)(\$(?:\\.|[^$])+?\$)', re.DOTALL)
+    # Block segments are sorted and disjoint, and an inline match cannot
+    # contain a '$', so it can only overlap the last block starting at or
+    # before it, or the next one; such matches are dropped
+    block_starts = [start for _, start, _ in segments]
+    block_ends = [end for _, _, end in segments]
     for m in inline_pattern.finditer(markdown_text):
-        if any(start <= m.start() < end for _, start, end in segments):
+        i = bisect.bisect_right(block_starts, m.start()) - 1
+        if i >= 0 and m.start() < block_ends[i]:
+            continue
+        if i + 1 < len(block_starts) and m.end() > block_starts[i + 1]:
             continue
         segments.append((m.group(1), m.start(), m.end()))
 
-    return segments
+    # `$` inside code is not LaTeX
+    code = sorted(code_spans(markdown_text))
+    code_starts = [start for start, _ in code]
+    def in_code(start, end):
+        i = bisect.bisect_left(code_starts, end) - 1
+        return i >= 0 and code[i][1] > start
+    return [seg for seg in segments if not in_code(seg[1], seg[2])]
 
 
 def latex_checks(latex_str: str) -> List[str]:
@@ -284,6 +319,7 @@ def modify_latex(markdown_text: str, error_report: Dict[Tuple[str,int], List[str
     遍历 error_report，按 start_idx 从大到小替换，
     保证后面的替换不影响前面的 start_idx。
     """
+    from xai_sdk.chat import system, user
     corrected = markdown_text
     items = sorted(error_report.items(), key=lambda x: x[0][1], reverse=True)
 
@@ -299,11 +335,11 @@ def modify_latex(markdown_text: str, error_report: Dict[Tuple[str,int], List[str
         # fixed = generate([
         #     {"role":"system","content":"你是 LaTeX 专家，负责修正以下代码："},
         #     {"role":"user","content":user_msg}
-        # ], deepseek, "deepseek-reasoner").strip()
+        # ], deepseek_client(), "deepseek-reasoner").strip()
         fixed = grok_generate([
             system("你是 LaTeX 专家，负责修正以下代码："),
             user(user_msg)
-        ], xai_client, "grok-4-fast-reasoning").strip()
+        ], xai_client(), "grok-4-fast-reasoning").strip()
 
         # 去掉```，如果不小心生成了
         if fixed.startswith("```") and fixed.endswith("```"):
@@ -322,105 +358,193 @@ def modify_latex(markdown_text: str, error_report: Dict[Tuple[str,int], List[str
     return corrected
 
 is_latin = lambda ch: '\u0000' <= ch <= '\u007F' or '\u00A0' <= ch <= '\u024F'
-is_nonspace_latin = lambda ch: is_latin(ch) and not ch.isspace() and not ch in """*()[]{}"'/-@#"""
+is_nonspace_latin = lambda ch: is_latin(ch) and not ch.isspace() and not ch in """*()[]{}"'/-@#~"""
 is_nonpunct_cjk = lambda ch: not is_latin(ch) and ch not in "·！￥…（）—【】、；：‘’“”，。《》？「」"
 
-# beautify的时候跳过 LaTeX
+def space_cjk_latin(part: str) -> str:
+    out = []
+    prev_latin = prev_cjk = False
+    for char in part:
+        latin = is_nonspace_latin(char)
+        cjk = not latin and is_nonpunct_cjk(char)
+        if (latin and prev_cjk) or (prev_latin and cjk):
+            out.append(" ")
+        out.append(char)
+        prev_latin, prev_cjk = latin, cjk
+    return "".join(out)
+
+# beautify的时候跳过 LaTeX 和代码
 def beautify_string(text: str) -> str:
-    segments = extract_latex_segments(text)
-    segments.sort(key=lambda x: x[1])
+    spans = sorted(code_spans(text) + [(start, end) for _, start, end in extract_latex_segments(text)])
 
     result_parts = []
     last_end = 0
 
-    for seg_content, seg_start, seg_end in segments:
-        non_latex_part = text[last_end:seg_start]
-        processed_part = ""
-        for i, char in enumerate(non_latex_part):
-            if i > 0 and (
-                (is_nonspace_latin(char) and is_nonpunct_cjk(non_latex_part[i-1])) or
-                (is_nonspace_latin(non_latex_part[i-1]) and is_nonpunct_cjk(char))
-            ):
-                processed_part += " "
-            processed_part += char
-        result_parts.append(processed_part)
-
-        result_parts.append(seg_content)
+    for seg_start, seg_end in spans:
+        if seg_end <= last_end:
+            continue
+        if seg_start > last_end:
+            result_parts.append(space_cjk_latin(text[last_end:seg_start]))
+        result_parts.append(text[max(seg_start, last_end):seg_end])
         last_end = seg_end
 
-    final_part = text[last_end:]
-    processed_final_part = ""
-    for i, char in enumerate(final_part):
-         if i > 0 and (
-             (is_nonspace_latin(char) and is_nonpunct_cjk(final_part[i-1])) or
-             (is_nonspace_latin(final_part[i-1]) and is_nonpunct_cjk(char))
-         ):
-            processed_final_part += " "
-         processed_final_part += char
-    result_parts.append(processed_final_part)
+    result_parts.append(space_cjk_latin(text[last_end:]))
 
     return "".join(result_parts)
 
-start = time.time()
-print("     Generating topic:")
-topic = beautify_string(extract_topic(topics_text))
-print(f"     Determined topic: {topic}; time spent {time.time() - start:.1f} s")
-
-start = time.time()
-print("   Generating outline:")
-outline_result = beautify_string(outline(topic))
-print(f"   Determined outline: time spent {time.time() - start:.1f} s")
-
-start = time.time()
-print("   Generating article:")
-article = write_from_outline(outline_result)
-print(f"      Article written: time spent {time.time() - start:.1f} s")
-
-start = time.time()
-while latex_errors(article):
-    print("latex_errors still exist")
-    article = modify_latex(article, latex_errors(article))
-
-print(f"      LaTeX errors fixed: time spent {time.time() - start:.1f} s")
-
-start = time.time()
-article = beautify_string(article)
-print(f"      Article beautified: time spent {time.time() - start:.1f} s")
-
-
-start = time.time()
-print("   Generating summary:")
-summary_result = beautify_string(summary(article))
-print(f"      Decided Summary: {summary_result}; time spent {time.time() - start:.1f} s")
-
-lines = iter(article.splitlines())
-markdown_file = ""
-author = random.choice(["杨其臻", "杨子凡", "叶家炜", "黄京", "王思成", "黄梓淳", "马浩琨", "杨岢瑞", "李睿远"])
-print(f"        Rolled author: {author}")
-
-for line in lines:
-    if line.startswith("# "):
-        # Sometimes the LLM does not produce a top-level title
-        # So we simply use the aforementioned topic instead
-        # title = line[1:].strip().split("：")[0]
-
-        metadata = "\n".join([
-            "---",
-            f'title: "{topic}"',
-            f'author: "{author}"',
-            f'date: "{datetime.datetime.now().strftime("%b %d, %Y")}"',
-            f'description: "{summary_result}"',
-            'latex: true',
-            'pdf: true',
-            "---",
-        ]) + "\n"
-
-        markdown_file += metadata
-        break
-
-markdown_file += clean_text.clean_text(lines)
-
-with open(f"{path_to}/index.md", "w", encoding="utf-8") as f:
-    f.write(markdown_file)
-
-print(f"     Composed article: {path_to}/index.md")
+def compose():
+    path_to = f'{blog_dir}/{datetime.datetime.now().strftime("%Y-%m-%d")}'
+
+    if os.path.exists(path_to):
+        print(f"   Skipping directory: {path_to}")
+        return
+    else:
+        os.makedirs(path_to, exist_ok=True)
+        print(f"     Making directory: {path_to}")
+
+    start = time.time()
+    print("    Connecting remote:")
+    xai_client()
+    print(f"   Time spent on init: {time.time() - start:.1f} s")
+
+    # Get existing blog posts
+    existing_posts = get_existing_blog_posts()
+    print(f"              Loading: {len(existing_posts)} existing blog posts")
+
+    topics = [topic.get_text(strip=True) for topic in scrape_website("https://news.ycombinator.com/", ".titleline")]
+    topics_text = "\n".join(random.choices(topics, k=random.randint(5, len(topics))))
+    print(f"              Scraped: {len(topics)} topics")
+
+    start = time.time()
+    print("     Generating topic:")
+    topic = beautify_string(extract_topic(topics_text))
+    print(f"     Determined topic: {topic}; time spent {time.time() - start:.1f} s")
+
+    start = time.time()
+    print("   Generating outline:")
+    outline_result = beautify_string(outline(topic))
+    print(f"   Determined outline: time spent {time.time() - start:.1f} s")
+
+    start = time.time()
+    print("   Generating article:")
+    article = write_from_outline(outline_result)
+    print(f"      Article written: time spent {time.time() - start:.1f} s")
+
+    start = time.time()
+    while latex_errors(article):
+        print("latex_errors still exist")
+        article = modify_latex(article, latex_errors(article))
+
+    print(f"      LaTeX errors fixed: time spent {time.time() - start:.1f} s")
+
+    start = time.time()
+    article = beautify_string(article)
+    print(f"      Article beautified: time spent {time.time() - start:.1f} s")
+
+
+    start = time.time()
+    print("   Generating summary:")
+    summary_result = beautify_string(summary(article))
+    print(f"      Decided Summary: {summary_result}; time spent {time.time() - start:.1f} s")
+
+    lines = iter(article.splitlines())
+    markdown_file = ""
+    author = random.choice(["杨其臻", "杨子凡", "叶家炜", "黄京", "王思成", "黄梓淳", "马浩琨", "杨岢瑞", "李睿远"])
+    print(f"        Rolled author: {author}")
+
+    for line in lines:
+        if line.startswith("# "):
+            # Sometimes the LLM does not produce a top-level title
+            # So we simply use the aforementioned topic instead
+            # title = line[1:].strip().split("：")[0]
+
+            metadata = "\n".join([
+                "---",
+                f'title: "{topic}"',
+                f'author: "{author}"',
+                f'date: "{datetime.datetime.now().strftime("%b %d, %Y")}"',
+                f'description: "{summary_result}"',
+                'latex: true',
+                'pdf: true',
+                "---",
+            ]) + "\n"
+
+            markdown_file += metadata
+            break
+
+    markdown_file += clean_text.clean_text(lines)
+
+    with open(f"{path_to}/index.md", "w", encoding="utf-8") as f:
+        f.write(markdown_file)
+
+    print(f"     Composed article: {path_to}/index.md")
+
+def collect_posts(paths: List[str]) -> List[str]:
+    # Expands directories to the posts below them; defaults to the whole blog
+    files = []
+    for path in paths or [blog_dir]:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "**", "index.md"), recursive=True))
+        else:
+            files.append(path)
+    return files
+
+def split_frontmatter(content: str) -> Tuple[str, str]:
+    if content.startswith("---"):
+        end = content.find("\n---", 3)
+        if end != -1:
+            end = content.find("\n", end + 4) + 1 or len(content)
+            return content[:end], content[end:]
+    return "", content
+
+def lint(paths: List[str]) -> int:
+    failed = 0
+    files = collect_posts(paths)
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            frontmatter, body = split_frontmatter(f.read())
+        offset = frontmatter.count("\n")
+        report = latex_errors(body)
+        for (seg, start_idx), errs in sorted(report.items(), key=lambda x: x[0][1]):
+            line = offset + body.count("\n", 0, start_idx) + 1
+            col = start_idx - body.rfind("\n", 0, start_idx)
+            for err in errs:
+                print(f"{path}:{line}:{col}: {err}")
+        failed += bool(report)
+    print(f"         Linted posts: {len(files)}; {failed} with LaTeX errors", file=sys.stderr)
+    return 1 if failed else 0
+
+def beautify(paths: List[str], check: bool) -> int:
+    # With `check`, only reports the posts that would change
+    changed = 0
+    files = collect_posts(paths)
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+        frontmatter, body = split_frontmatter(content)
+        result = frontmatter + beautify_string(body)
+        if result != content:
+            if check:
+                print(f"      Would beautify: {path}")
+            else:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(result)
+                print(f"           Beautified: {path}")
+            changed += 1
+    print(f"      {'Unbeautified' if check else 'Beautified'} posts: {changed} of {len(files)}", file=sys.stderr)
+    return 1 if check and changed else 0
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("writer: Incorrect options...")
+        sys.exit(2)
+    elif sys.argv[1] == "generate":
+        compose()
+    elif sys.argv[1] == "lint":
+        sys.exit(lint(sys.argv[2:]))
+    elif sys.argv[1] == "beautify":
+        # Rewrites only the paths given; `--check` (the default without paths) only reports
+        paths = [arg for arg in sys.argv[2:] if arg != "--check"]
+        sys.exit(beautify(paths, check="--check" in sys.argv[2:] or not paths))
+    else:
+        print("writer: Doing nothing...")